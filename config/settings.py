@@ -61,6 +61,7 @@ class Settings:
     DOWNLOAD_CONFIG: Dict[str, Union[Path, int, List[str]]] = {
         'directory': BASE_DIR / 'downloads',
         'max_size': int(os.getenv('MAX_DOWNLOAD_SIZE', 50 * 1024 * 1024)),  # 50 MB
+        'chunk_size': int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024)),  # 64 KB
         'allowed_media_types': os.getenv('ALLOWED_MEDIA_TYPES', 'jpg,png,mp4').split(',')
     }
 
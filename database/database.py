@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import create_engine, inspect
+import functools
+from typing import Any, Callable, Dict, List
+from sqlalchemy import Boolean, DateTime, create_engine, false, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.exc import SQLAlchemyError
@@ -13,8 +17,22 @@ logger = logging.getLogger(__name__)
 # Base class for declarative models
 Base = declarative_base()
 
+# Dialects supporting INSERT ... ON CONFLICT
+_UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert
+}
+
+# Unique indexes required by upsert conflict targets. create_all does not
+# add indexes to tables that already exist, so they are ensured separately.
+_UPSERT_INDEX_DDL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_instagram_credentials_user_id "
+    "ON instagram_credentials (user_id)",
+)
+
 class DatabaseManager:
     _instance = None
+    upsert_supported = False
     
     def __new__(cls):
         if not cls._instance:
@@ -32,6 +50,7 @@ class DatabaseManager:
                 max_overflow=20,  # Number of connections that can be created beyond pool_size
                 pool_timeout=30,  # Timeout for getting a connection from the pool
                 pool_recycle=1800,  # Recycle connections after 30 minutes
+                pool_pre_ping=True,  # Validate pooled connections before use
                 echo=Config.is_production() == False  # Enable SQL logging in development
             )
 
@@ -61,6 +80,57 @@ class DatabaseManager:
         except SQLAlchemyError as e:
             logger.error(f"Error creating database tables: {e}")
             raise
+        
+        self._ensure_user_block_columns()
+        self.upsert_supported = self._ensure_upsert_indexes()
+
+    def _ensure_user_block_columns(self):
+        """
+        Add the users.is_blocked and users.block_until columns to existing tables
+        
+        create_all does not alter tables that already exist, so databases
+        created before these columns were declared get them here.
+        """
+        try:
+            inspector = inspect(self.engine)
+            if 'users' not in inspector.get_table_names():
+                return
+            existing = {column['name'] for column in inspector.get_columns('users')}
+            
+            dialect = self.engine.dialect
+            columns = {
+                'is_blocked': (
+                    f"{Boolean().compile(dialect=dialect)} NOT NULL "
+                    f"DEFAULT {false().compile(dialect=dialect)}"
+                ),
+                'block_until': DateTime().compile(dialect=dialect)
+            }
+            with self.engine.begin() as connection:
+                for name, definition in columns.items():
+                    if name not in existing:
+                        connection.execute(text(f"ALTER TABLE users ADD COLUMN {name} {definition}"))
+                        logger.info(f"Added column users.{name}")
+        except SQLAlchemyError as e:
+            logger.error(f"Error adding user block columns: {e}")
+            raise
+
+    def _ensure_upsert_indexes(self) -> bool:
+        """
+        Create the unique indexes ON CONFLICT upserts rely on
+        
+        :return: Whether upserts can be used on this database
+        """
+        if self.engine.dialect.name not in _UPSERT_INSERTS:
+            return False
+        
+        try:
+            with self.engine.begin() as connection:
+                for ddl in _UPSERT_INDEX_DDL:
+                    connection.execute(text(ddl))
+            return True
+        except SQLAlchemyError as e:
+            logger.warning(f"Upsert indexes unavailable, falling back to select and write: {e}")
+            return False
 
     @contextmanager
     def get_session(self):
@@ -189,6 +259,68 @@ class DatabaseManager:
 # Singleton instance of DatabaseManager
 db_manager = DatabaseManager()
 
+def with_session(error_message: str, default: Any = False) -> Callable:
+    """
+    Decorator running a service method inside a database session
+
+    The session is passed to the method after ``self`` and committed when
+    the method returns. Any error is logged through the service logger and
+    ``default`` is returned instead.
+
+    :param error_message: Log message prefix used when the method fails
+    :param default: Value returned on failure
+    :return: Decorated method
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # Managed here rather than via get_session so failures are logged once
+            session = db_manager.Session()
+            try:
+                result = func(self, session, *args, **kwargs)
+                session.commit()
+                return result
+            except Exception as e:
+                session.rollback()
+                self.logger.error(f"{error_message}: {e}")
+                return default
+            finally:
+                session.close()
+        return wrapper
+    return decorator
+
+def upsert(session, model, values: Dict[str, Any], index_elements: List[str], update_values: Dict[str, Any]):
+    """
+    Insert a row or update it in place when it conflicts on a unique key
+
+    Uses INSERT ... ON CONFLICT where the dialect and indexes allow it, and
+    a SELECT followed by an INSERT or UPDATE otherwise.
+
+    :param session: Active database session
+    :param model: Mapped model class
+    :param values: Column values for the inserted row
+    :param index_elements: Columns of the unique index to resolve conflicts on
+    :param update_values: Column values applied to the existing row on conflict
+    """
+    dialect = session.get_bind().dialect.name
+    if not db_manager.upsert_supported or dialect not in _UPSERT_INSERTS:
+        row = session.query(model).filter_by(
+            **{column: values[column] for column in index_elements}
+        ).first()
+        if row is None:
+            session.add(model(**values))
+        else:
+            for column, value in update_values.items():
+                setattr(row, column, value)
+        return
+    
+    statement = _UPSERT_INSERTS[dialect](model).values(**values)
+    if update_values:
+        statement = statement.on_conflict_do_update(index_elements=index_elements, set_=update_values)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    session.execute(statement)
+
 # Optional: Cleanup function to be called on application shutdown
 def cleanup_database():
     db_manager.dispose()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -10,10 +10,12 @@ class User(Base):
 
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
-    instagram_username = Column(String, nullable=True)
+    instagram_username = Column(String, nullable=True, index=True)
     is_authenticated = Column(Boolean, default=False)
     last_login = Column(DateTime, default=datetime.utcnow)
     download_count = Column(Integer, default=0)
+    is_blocked = Column(Boolean, default=False, server_default=false(), nullable=False)
+    block_until = Column(DateTime, nullable=True)
 
     # Relationship with InstagramCredential
     credentials = relationship("InstagramCredential", back_populates="user")
@@ -23,6 +25,10 @@ class User(Base):
 
 class InstagramCredential(Base):
     __tablename__ = 'instagram_credentials'
+    __table_args__ = (
+        # Conflict target for credential upserts
+        Index('ix_instagram_credentials_user_id', 'user_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -41,7 +47,7 @@ class DownloadHistory(Base):
     __tablename__ = 'download_history'
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     media_type = Column(String, nullable=False)  # e.g., 'image', 'video'
     media_url = Column(String, nullable=False)
     download_time = Column(DateTime, default=datetime.utcnow)
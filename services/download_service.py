@@ -1,12 +1,19 @@
 import os
+import re
+import sys
+import time
 import uuid
+import secrets
 import logging
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import urlsplit
 
 import requests
-import aiofiles
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import aiohttp
 from tqdm import tqdm
 
@@ -14,7 +21,17 @@ from config.settings import settings
 from services.user_service import user_service
 from utils.security import security_manager
 
+# Accepted download URL shape: http(s) scheme, host, optional port and path
+_URL_RE = re.compile(r'https?://[A-Za-z0-9.\-]+(?::\d+)?(?:[/?#]\S*)?')
+
 class DownloadService:
+    # Fallback file extensions per media type
+    _EXT_MAP = {
+        'image': 'jpg',
+        'video': 'mp4',
+        'audio': 'mp3'
+    }
+
     def __init__(self):
         """
         Initialize download service
@@ -23,6 +40,32 @@ class DownloadService:
         self.download_directory = settings.DOWNLOAD_CONFIG['directory']
         self.max_download_size = settings.DOWNLOAD_CONFIG['max_size']
         self.allowed_media_types = settings.DOWNLOAD_CONFIG['allowed_media_types']
+        self._allowed_exts = frozenset(
+            ext.strip().lower().lstrip('.') for ext in self.allowed_media_types if ext.strip()
+        )
+        self.chunk_size = settings.DOWNLOAD_CONFIG['chunk_size']
+
+        # Progress bars only make sense on an interactive terminal
+        self._use_tqdm = sys.stderr.isatty()
+
+        # Filename sequence, randomly seeded so restarts do not reuse names
+        self._seq = itertools.count(secrets.randbits(32))
+
+        # User download directories already created, keyed by Telegram ID
+        self._user_dirs: Dict[int, Path] = {}
+
+        # Pooled HTTP session reused across synchronous downloads
+        self._sync_session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self._sync_session.mount('https://', adapter)
+        self._sync_session.mount('http://', adapter)
+
+        # Background workers for post-download encryption and scanning
+        self._post_exec = ThreadPoolExecutor(max_workers=2)
 
     def initialize(self, **kwargs):
         """
@@ -38,6 +81,7 @@ class DownloadService:
             'max_download_size', 
             self.max_download_size
         )
+        self._user_dirs.clear()
         self.logger.info("Download service initialized successfully")
 
     async def download_file(
@@ -83,22 +127,21 @@ class DownloadService:
                         self.logger.warning(f"File too large: {content_length} bytes")
                         return None
 
-                    # Download with progress
-                    async with aiofiles.open(download_path, 'wb') as f:
+                    # Download with progress, writing straight to the file descriptor
+                    fd = os.open(download_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
                         downloaded = 0
-                        async for chunk in response.content.iter_chunked(1024):
+                        async for chunk in response.content.iter_any():
                             downloaded += len(chunk)
-                            await f.write(chunk)
+                            self._write_all(fd, chunk)
 
                             # Optional: Implement download progress tracking
                             # You could add a callback or logging here
+                    finally:
+                        os.close(fd)
 
-            # Log download history
-            user_service.log_download(
-                telegram_id=telegram_id,
-                media_type=media_type,
-                media_url=download_path
-            )
+            # Queue download history for a batched write
+            user_service.log_download(telegram_id, media_type, download_path)
 
             self.logger.info(f"File downloaded: {download_path}")
             return download_path
@@ -136,37 +179,39 @@ class DownloadService:
             # Create download path
             download_path = self._create_download_path(telegram_id, filename)
 
-            # Download file with progress bar
-            response = requests.get(url, stream=True)
-            
-            # Check response status
-            if response.status_code != 200:
-                self.logger.error(f"Download failed. Status: {response.status_code}")
-                return None
-
-            # Check file size
-            content_length = int(response.headers.get('content-length', 0))
-            if content_length > self.max_download_size:
-                self.logger.warning(f"File too large: {content_length} bytes")
-                return None
-
-            # Download with progress bar
-            with open(download_path, 'wb') as f:
-                for chunk in tqdm(
-                    response.iter_content(chunk_size=8192), 
-                    total=int(content_length/8192), 
-                    unit='KB', 
-                    desc=filename
-                ):
-                    if chunk:
-                        f.write(chunk)
-
-            # Log download history
-            user_service.log_download(
-                telegram_id=telegram_id,
-                media_type=media_type,
-                media_url=download_path
-            )
+            # Download file with progress bar over the shared session
+            with self._sync_session.get(url, stream=True) as response:
+                # Check response status
+                if response.status_code != 200:
+                    self.logger.error(f"Download failed. Status: {response.status_code}")
+                    return None
+
+                # Check file size
+                content_length = int(response.headers.get('content-length', 0))
+                if content_length > self.max_download_size:
+                    self.logger.warning(f"File too large: {content_length} bytes")
+                    return None
+
+                # Download with progress bar
+                with open(download_path, 'wb') as f:
+                    chunks = response.iter_content(chunk_size=self.chunk_size)
+                    if self._use_tqdm:
+                        total_chunks = content_length // self.chunk_size
+                        chunks = tqdm(
+                            chunks, 
+                            total=total_chunks, 
+                            unit='chunk', 
+                            desc=filename,
+                            mininterval=1.0,
+                            miniters=max(1, total_chunks // 100)
+                        )
+
+                    for chunk in chunks:
+                        if chunk:
+                            f.write(chunk)
+
+            # Queue download history for a batched write
+            user_service.log_download(telegram_id, media_type, download_path)
 
             self.logger.info(f"File downloaded: {download_path}")
             return download_path
@@ -175,6 +220,19 @@ class DownloadService:
             self.logger.error(f"Download error: {e}")
             return None
 
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        """
+        Write a whole buffer to a raw file descriptor
+        
+        :param fd: File descriptor opened for writing
+        :param data: Bytes to write
+        """
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
     def _validate_url(self, url: str) -> bool:
         """
         Validate download URL
@@ -182,18 +240,7 @@ class DownloadService:
         :param url: URL to validate
         :return: Validation status
         """
-        try:
-            # Basic URL validation
-            if not url.startswith(('http://', 'https://')):
-                return False
-
-            # Optional: Add more sophisticated URL validation
-            parsed_url = requests.utils.urlparse(url)
-            return all([parsed_url.scheme, parsed_url.netloc])
-
-        except Exception as e:
-            self.logger.error(f"URL validation error: {e}")
-            return False
+        return _URL_RE.fullmatch(url) is not None
 
     def _generate_filename(self, url: str, media_type: str) -> str:
         """
@@ -207,10 +254,10 @@ class DownloadService:
         file_ext = self._get_file_extension(url, media_type)
         
         # Generate unique filename
-        unique_id = str(uuid.uuid4())[:8]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        seq = next(self._seq) & 0xFFFFFFFF
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
         
-        return f"{media_type}_{timestamp}_{unique_id}.{file_ext}"
+        return f"{media_type}_{timestamp}_{seq:08x}.{file_ext}"
 
     def _get_file_extension(self, url: str, media_type: str) -> str:
         """
@@ -220,26 +267,16 @@ class DownloadService:
         :param media_type: Media type
         :return: File extension
         """
-        # Try to extract extension from URL
-        parsed_url = requests.utils.urlparse(url)
-        path = parsed_url.path
-        
-        # Check URL path for extension
-        if '.' in path:
-            ext = path.split('.')[-1]
-            if ext.lower() in self.allowed_media_types:
-                return ext.lower()
+        # Try to extract extension from URL path
+        _, ext = os.path.splitext(urlsplit(url).path)
+        ext = ext[1:].lower()
+        if ext in self._allowed_exts:
+            return ext
         
         # Fallback to media type mapping
-        ext_mapping = {
-            'image': 'jpg',
-            'video': 'mp4',
-            'audio': 'mp3'
-        }
-        
-        return ext_mapping.get(media_type, 'bin')
+        return self._EXT_MAP.get(media_type, 'bin')
 
-        def _create_download_path(self, telegram_id: int, filename: str) -> str:
+    def _create_download_path(self, telegram_id: int, filename: str) -> str:
         """
         Create download directory and full file path
         
@@ -247,9 +284,12 @@ class DownloadService:
         :param filename: Filename to use
         :return: Full path to download file
         """
-        # Create user-specific download directory
-        user_download_dir = self.download_directory / str(telegram_id)
-        user_download_dir.mkdir(parents=True, exist_ok=True)
+        # Create user-specific download directory once per user
+        user_download_dir = self._user_dirs.get(telegram_id)
+        if user_download_dir is None:
+            user_download_dir = self.download_directory / str(telegram_id)
+            user_download_dir.mkdir(parents=True, exist_ok=True)
+            self._user_dirs[telegram_id] = user_download_dir
 
         # Generate full download path
         return str(user_download_dir / filename)
@@ -277,39 +317,40 @@ class DownloadService:
             self.logger.error(f"File security error: {e}")
             return None
 
+    def schedule_secure(self, file_path: str) -> Future:
+        """
+        Secure a downloaded file in the background
+        
+        The caller can hand the plain file to the user right away and
+        await the returned future for the secured file path.
+        
+        :param file_path: Path to the file
+        :return: Future resolving to the secured file path or None
+        """
+        return self._post_exec.submit(self.secure_file, file_path)
+
     def _encrypt_file(self, file_path: str) -> str:
         """
-        Encrypt a file using Fernet symmetric encryption
+        Encrypt a file using streamed AES-GCM symmetric encryption
         
         :param file_path: Path to the file
         :return: Path to encrypted file
         """
         try:
-            # Generate encryption key
-            encryption_key = security_manager.generate_encryption_key()
-            
-            # Read file content
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-            
-            # Encrypt file content
-            encrypted_content = security_manager.encrypt_data(
-                file_content.decode('latin-1'), 
-                key=encryption_key
-            )
-            
             # Generate encrypted file path
             encrypted_file_path = f"{file_path}.encrypted"
             
-            # Write encrypted content
-            with open(encrypted_file_path, 'wb') as f:
-                f.write(encrypted_content['encrypted_data'].encode('latin-1'))
+            # Encrypt file content chunk by chunk
+            encryption_key = security_manager.encrypt_file(
+                file_path, 
+                encrypted_file_path
+            )
             
             # Optional: Store encryption key securely
             # In a real-world scenario, you'd use a secure key management system
             key_file_path = f"{file_path}.key"
             with open(key_file_path, 'wb') as f:
-                f.write(encrypted_content['encryption_key'].encode())
+                f.write(encryption_key)
             
             return encrypted_file_path
 
@@ -349,22 +390,19 @@ class DownloadService:
         :param days: Number of days to retain files
         """
         try:
-            current_time = datetime.now()
+            cutoff = time.time() - days * 86400
             
             # Iterate through all user download directories
-            for user_dir in self.download_directory.iterdir():
+            for user_dir in os.scandir(self.download_directory):
                 if user_dir.is_dir():
-                    for file_path in user_dir.iterdir():
-                        # Check file modification time
-                        file_mod_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-                        
+                    for entry in os.scandir(user_dir.path):
                         # Remove files older than specified days
-                        if (current_time - file_mod_time).days > days:
+                        if entry.stat().st_mtime < cutoff:
                             try:
-                                file_path.unlink()
-                                self.logger.info(f"Deleted old file: {file_path}")
+                                os.unlink(entry.path)
+                                self.logger.info(f"Deleted old file: {entry.path}")
                             except Exception as e:
-                                self.logger.error(f"Error deleting file {file_path}: {e}")
+                                self.logger.error(f"Error deleting file {entry.path}: {e}")
 
         except Exception as e:
             self.logger.error(f"Download cleanup error: {e}")
@@ -388,21 +426,28 @@ class DownloadService:
             if telegram_id:
                 user_download_dir = self.download_directory / str(telegram_id)
                 if user_download_dir.exists():
-                    for file_path in user_download_dir.iterdir():
-                        stats['total_downloads'] += 1
-                        stats['total_size'] += file_path.stat().st_size
-                        
-                        # Media type breakdown
-                        media_type = file_path.stem.split('_')[0]
-                        stats['media_type_breakdown'][media_type] = \
-                            stats['media_type_breakdown'].get(media_type, 0) + 1
+                    self._collect_user_stats(user_download_dir, stats)
             
-            # Global statistics for all users
+            # Global statistics for all users, gathered in a single pass
             else:
-                for user_dir in self.download_directory.iterdir():
-                    if user_dir.is_dir():
-                        user_stats = self.get_download_stats(int(user_dir.name))
-                        stats['user_downloads'][user_dir.name] = user_stats
+                for user_dir in os.scandir(self.download_directory):
+                    if not user_dir.is_dir():
+                        continue
+
+                    user_stats = {
+                        'total_downloads': 0,
+                        'total_size': 0,
+                        'media_type_breakdown': {}
+                    }
+                    self._collect_user_stats(user_dir.path, user_stats)
+                    stats['user_downloads'][user_dir.name] = user_stats
+
+                    # Roll user figures up into the global totals
+                    stats['total_downloads'] += user_stats['total_downloads']
+                    stats['total_size'] += user_stats['total_size']
+                    for media_type, count in user_stats['media_type_breakdown'].items():
+                        stats['media_type_breakdown'][media_type] = \
+                            stats['media_type_breakdown'].get(media_type, 0) + count
 
             return stats
 
@@ -410,6 +455,22 @@ class DownloadService:
             self.logger.error(f"Download stats retrieval error: {e}")
             return {}
 
+    def _collect_user_stats(self, user_dir, stats: Dict[str, Any]) -> None:
+        """
+        Accumulate file statistics of a user download directory
+        
+        :param user_dir: Path to the user download directory
+        :param stats: Statistics dictionary to update in place
+        """
+        breakdown = stats['media_type_breakdown']
+        for entry in os.scandir(user_dir):
+            stats['total_downloads'] += 1
+            stats['total_size'] += entry.stat().st_size
+            
+            # Media type breakdown
+            media_type = entry.name.split('.', 1)[0].partition('_')[0]
+            breakdown[media_type] = breakdown.get(media_type, 0) + 1
+
     def health_check(self) -> bool:
         """
         Perform service health check
@@ -437,7 +498,9 @@ class DownloadService:
         Perform cleanup and shutdown for the service
         """
         self.logger.info("Download service shutting down")
+        self._post_exec.shutdown(wait=True)
         self.cleanup_old_downloads()
+        self._sync_session.close()
 
 # Create a singleton instance
 download_service = DownloadService()
@@ -1,14 +1,30 @@
 import os
+import asyncio
+import aiohttp
 import instaloader
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-from typing import List, Dict, Optional
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Lock
+from typing import List, Dict, Optional, Iterable, Iterator
 from datetime import datetime, timedelta
-from database.database import db_manager
-from database.models import User, DownloadHistory
+from database.database import upsert, with_session
+from database.models import User, InstagramCredential
+from services.user_service import user_service
 from utils.security import security_manager
 import logging
 
+# Instagram usernames: 3-30 letters, digits, dots or underscores
+_USERNAME_RE = re.compile(r'[a-zA-Z0-9._]{3,30}')
+
+# Post shortcode segment of an Instagram post URL
+_SHORTCODE_RE = re.compile(r'/p/([^/]+)')
+
 class InstagramService:
     def __init__(self):
         """
@@ -18,8 +34,58 @@ class InstagramService:
         self.loader = instaloader.Instaloader()
         self.temp_download_dir = "downloads/instagram"
         
+        # Directories already known to exist, to skip repeat makedirs calls
+        self._known_dirs = set()
+        
         # Ensure download directory exists
-        os.makedirs(self.temp_download_dir, exist_ok=True)
+        self._ensure_dir(self.temp_download_dir)
+
+        # Pooled HTTP session reused across synchronous downloads
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self._http.mount('https://', adapter)
+
+        # Shared HTTP session for concurrent downloads, created lazily
+        self._aio_session: Optional[aiohttp.ClientSession] = None
+        self._aio_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Worker threads for blocking instaloader calls made from async code
+        self._executor = ThreadPoolExecutor(max_workers=4)
+
+        # Recently fetched profiles, to avoid repeat GraphQL round-trips
+        self._profile_cache = TTLCache(maxsize=1024, ttl=120)
+        self._profile_cache_lock = Lock()
+
+    def _ensure_dir(self, path: str):
+        """
+        Create a directory once per service lifetime
+        
+        :param path: Directory path
+        """
+        if path not in self._known_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._known_dirs.add(path)
+
+    def _get_profile(self, username: str) -> instaloader.Profile:
+        """
+        Fetch an Instagram profile, served from a short-lived cache
+        
+        :param username: Instagram username
+        :return: Instaloader profile
+        """
+        with self._profile_cache_lock:
+            profile = self._profile_cache.get(username)
+        
+        if profile is None:
+            profile = instaloader.Profile.from_username(self.loader.context, username)
+            with self._profile_cache_lock:
+                self._profile_cache[username] = profile
+        
+        return profile
 
     def login(self, username: str, password: str) -> bool:
         """
@@ -30,18 +96,18 @@ class InstagramService:
         :return: Login status
         """
         try:
-            # Encrypt credentials before storage
-            encrypted_username = security_manager.encrypt_data(username)
-            encrypted_password = security_manager.encrypt_data(password)
-
             # Attempt login
             self.loader.login(username, password)
             
+            # Encrypt credentials only once login succeeded
+            encrypted_username = security_manager.encrypt_data(username)
+            encrypted_password = security_manager.encrypt_data(password)
+            
             # Save credentials securely
             self._save_credentials(
                 username, 
-                encrypted_username['encrypted_data'], 
-                encrypted_password['encrypted_data']
+                security_manager.as_text(encrypted_username['encrypted_data']), 
+                security_manager.as_text(encrypted_password['encrypted_data'])
             )
             
             return True
@@ -49,39 +115,39 @@ class InstagramService:
             self.logger.error(f"Instagram login failed: {e}")
             return False
 
-    def _save_credentials(self, username: str, enc_username: str, enc_password: str):
+    @with_session("Credential saving error", default=None)
+    def _save_credentials(self, session: Session, username: str, enc_username: str, enc_password: str):
         """
         Save encrypted Instagram credentials
         
+        :param session: Active database session
         :param username: Instagram username
         :param enc_username: Encrypted username
         :param enc_password: Encrypted password
         """
-        try:
-            with db_manager.get_session() as session:
-                # Find or create user
-                user = session.query(User).filter_by(instagram_username=username).first()
-                if not user:
-                    user = User(instagram_username=username)
-                    session.add(user)
-                
-                # Create or update credentials
-                credential = user.credentials[0] if user.credentials else None
-                if credential:
-                    credential.encrypted_username = enc_username
-                    credential.encrypted_password = enc_password
-                else:
-                    # Create new credential
-                    credential = InstagramCredential(
-                        user_id=user.id,
-                        encrypted_username=enc_username,
-                        encrypted_password=enc_password
-                    )
-                    session.add(credential)
-                
-                session.commit()
-        except Exception as e:
-            self.logger.error(f"Credential saving error: {e}")
+        # Find or create user
+        user_id = session.query(User.id).filter_by(instagram_username=username).limit(1).scalar()
+        if user_id is None:
+            user = User(instagram_username=username)
+            session.add(user)
+            session.flush()
+            user_id = user.id
+        
+        # Create or update credentials in the same transaction
+        upsert(
+            session,
+            InstagramCredential,
+            {
+                'user_id': user_id,
+                'encrypted_username': enc_username,
+                'encrypted_password': enc_password
+            },
+            index_elements=['user_id'],
+            update_values={
+                'encrypted_username': enc_username,
+                'encrypted_password': enc_password
+            }
+        )
 
     def download_profile_picture(self, username: str) -> Optional[str]:
         """
@@ -93,16 +159,93 @@ class InstagramService:
         try:
             # Create profile-specific download directory
             profile_dir = os.path.join(self.temp_download_dir, username)
-            os.makedirs(profile_dir, exist_ok=True)
+            self._ensure_dir(profile_dir)
 
             # Download profile picture
-            profile = instaloader.Profile.from_username(self.loader.context, username)
+            profile = self._get_profile(username)
+            profile_pic_filename = f"{username}_profile_pic.jpg"
+            profile_pic_path = os.path.join(profile_dir, profile_pic_filename)
+
+            # Stream profile picture to disk
+            with self._http.get(profile.profile_pic_url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                with open(profile_pic_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+
+            # Log download history
+            self._log_download_history(username, profile_pic_path, 'profile_picture')
+
+            return profile_pic_path
+        except Exception as e:
+            self.logger.error(f"Profile picture download failed: {e}")
+            return None
+
+    async def _get_http_session(self) -> aiohttp.ClientSession:
+        """
+        Get the shared aiohttp session, creating it on first use
+        
+        A session is bound to the event loop that created it, so a new one is
+        made whenever the running loop changes (e.g. one asyncio.run per call).
+        
+        :return: Client session with a bounded connection pool
+        """
+        loop = asyncio.get_running_loop()
+        if self._aio_session is not None and not self._aio_session.closed and self._aio_loop is not loop:
+            # Stale session from a previous loop; it cannot be awaited here
+            self._close_aio_session()
+            self._aio_session = None
+        
+        if self._aio_session is None or self._aio_session.closed:
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, limit_per_host=8)
+            )
+            self._aio_loop = loop
+        return self._aio_session
+
+    async def _fetch_to_file(self, url: str, file_path: str):
+        """
+        Stream a remote file to disk
+        
+        :param url: URL of the file
+        :param file_path: Destination path
+        """
+        loop = asyncio.get_running_loop()
+        session = await self._get_http_session()
+        async with session.get(url) as response:
+            response.raise_for_status()
+            
+            # File I/O runs on the worker threads to keep the event loop free
+            f = await loop.run_in_executor(self._executor, open, file_path, 'wb')
+            try:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    await loop.run_in_executor(self._executor, f.write, chunk)
+            finally:
+                await loop.run_in_executor(self._executor, f.close)
+
+    async def download_profile_picture_async(self, username: str) -> Optional[str]:
+        """
+        Download Instagram profile picture without blocking the event loop
+        
+        :param username: Instagram username
+        :return: Path to downloaded profile picture
+        """
+        try:
+            loop = asyncio.get_running_loop()
+
+            # Create profile-specific download directory
+            profile_dir = os.path.join(self.temp_download_dir, username)
+            self._ensure_dir(profile_dir)
+
+            # Resolve profile metadata off the event loop
+            profile = await loop.run_in_executor(
+                self._executor, self._get_profile, username
+            )
             profile_pic_filename = f"{username}_profile_pic.jpg"
             profile_pic_path = os.path.join(profile_dir, profile_pic_filename)
 
             # Save profile picture
-            with open(profile_pic_path, 'wb') as f:
-                f.write(requests.get(profile.profile_pic_url).content)
+            await self._fetch_to_file(profile.profile_pic_url, profile_pic_path)
 
             # Log download history
             self._log_download_history(username, profile_pic_path, 'profile_picture')
@@ -112,6 +255,92 @@ class InstagramService:
             self.logger.error(f"Profile picture download failed: {e}")
             return None
 
+    async def download_profiles_bulk(self, usernames: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Download several profile pictures concurrently
+        
+        :param usernames: Instagram usernames
+        :return: Mapping of username to downloaded path (None on failure)
+        """
+        usernames = list(usernames)
+        paths = await asyncio.gather(
+            *(self.download_profile_picture_async(username) for username in usernames)
+        )
+        return dict(zip(usernames, paths))
+
+    async def download_user_posts_async(self, username: str, limit: int = 10) -> List[str]:
+        """
+        Download the media of a user's recent posts concurrently
+        
+        Post metadata is enumerated sequentially, media bodies are fetched in parallel.
+        
+        :param username: Instagram username
+        :param limit: Number of posts to download
+        :return: Paths of the downloaded media
+        """
+        loop = asyncio.get_running_loop()
+        posts = await loop.run_in_executor(self._executor, self.get_user_posts, username, limit)
+
+        async def fetch(post: Dict) -> Optional[str]:
+            try:
+                shortcode = post['shortcode']
+                download_dir = os.path.join(self.temp_download_dir, 'posts', shortcode)
+                self._ensure_dir(download_dir)
+
+                # post['url'] is only the display image; videos have their own URL
+                video_url = post.get('video_url')
+                extension = '.mp4' if video_url else '.jpg'
+                file_path = os.path.join(download_dir, f"{shortcode}_media{extension}")
+                await self._fetch_to_file(video_url or post['url'], file_path)
+
+                # Log download history
+                self._log_download_history(username, file_path, post['media_type'])
+                return file_path
+            except Exception as e:
+                self.logger.error(f"Post media download failed: {e}")
+                return None
+
+        paths = await asyncio.gather(*(fetch(post) for post in posts))
+        return [path for path in paths if path]
+
+    async def login_async(self, username: str, password: str) -> bool:
+        """
+        Login to Instagram account without blocking the event loop
+        
+        :param username: Instagram username
+        :param password: Instagram password
+        :return: Login status
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.login, username, password)
+
+    async def download_post_async(self, post_url: str) -> Optional[str]:
+        """
+        Download a specific Instagram post without blocking the event loop
+        
+        :param post_url: URL of the Instagram post
+        :return: Path to downloaded media
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.download_post, post_url)
+
+    async def check_profile_exists_async(self, username: str) -> bool:
+        """
+        Check if an Instagram profile exists without blocking the event loop
+        
+        :param username: Instagram username
+        :return: Profile existence status
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.check_profile_exists, username)
+
+    async def aclose(self):
+        """
+        Close the shared HTTP session
+        """
+        if self._aio_session is not None and not self._aio_session.closed:
+            await self._aio_session.close()
+
     def get_user_posts(self, username: str, limit: int = 10) -> List[Dict]:
         """
         Retrieve recent posts from a user's profile
@@ -121,23 +350,21 @@ class InstagramService:
         :return: List of post details
         """
         try:
-            profile = instaloader.Profile.from_username(self.loader.context, username)
+            profile = self._get_profile(username)
             
-            posts = []
-            for index, post in enumerate(profile.get_posts(), 1):
-                if index > limit:
-                    break
-                
-                post_details = {
+            posts = [
+                {
                     'shortcode': post.shortcode,
                     'likes_count': post.likes,
                     'comments_count': post.comments,
                     'caption': post.caption or '',
                     'timestamp': post.date_utc,
                     'media_type': 'image' if post.is_image else 'video',
-                    'url': post.url
+                    'url': post.url,
+                    'video_url': post.video_url if post.is_video else None
                 }
-                posts.append(post_details)
+                for post in islice(profile.get_posts(), limit)
+            ]
             
             return posts
         except Exception as e:
@@ -160,7 +387,7 @@ class InstagramService:
             
             # Create download directory
             download_dir = os.path.join(self.temp_download_dir, 'posts', shortcode)
-            os.makedirs(download_dir, exist_ok=True)
+            self._ensure_dir(download_dir)
             
             # Download media
             filename = f"{shortcode}_media{'.mp4' if post.is_video else '.jpg'}"
@@ -187,31 +414,18 @@ class InstagramService:
         :param url: Instagram post URL
         :return: Post shortcode
         """
-        match = re.search(r'/p/([^/]+)', url)
+        match = _SHORTCODE_RE.search(url)
         return match.group(1) if match else None
 
     def _log_download_history(self, username: str, file_path: str, media_type: str):
         """
-        Log download history in database
+        Queue download history through the user service's batched writer
         
         :param username: Instagram username
         :param file_path: Path of downloaded media
         :param media_type: Type of media downloaded
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(instagram_username=username).first()
-                
-                if user:
-                    download_history = DownloadHistory(
-                        user_id=user.id,
-                        media_type=media_type,
-                        media_url=file_path
-                    )
-                    session.add(download_history)
-                    session.commit()
-        except Exception as e:
-            self.logger.error(f"Download history logging failed: {e}")
+        user_service.log_download_by_username(username, media_type, file_path)
 
     def cleanup_old_downloads(self, days: int = 7):
         """
@@ -220,22 +434,64 @@ class InstagramService:
         :param days: Number of days to retain files
         """
         try:
-            cutoff_date = datetime.now() - timedelta(days=days)
+            cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
+            
+            paths_to_delete = [
+                entry.path
+                for entry in self._iter_files(self.temp_download_dir)
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff_ts
+            ]
             
-            for root, dirs, files in os.walk(self.temp_download_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    file_modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    
-                                        if file_modified_time < cutoff_date:
-                        try:
-                            os.remove(file_path)
-                            self.logger.info(f"Deleted old file: {file_path}")
-                        except Exception as e:
-                            self.logger.error(f"Failed to delete file {file_path}: {e}")
+            # Unlinks are I/O bound, so fan them out across threads
+            failures = []
+            if paths_to_delete:
+                max_workers = min(32, (os.cpu_count() or 1) * 4)
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    failures = [
+                        error
+                        for error in executor.map(self._unlink_quietly, paths_to_delete)
+                        if error
+                    ]
+            deleted = len(paths_to_delete) - len(failures)
+            
+            # Report outcome once instead of per file
+            if deleted:
+                self.logger.info(f"Deleted {deleted} old files from {self.temp_download_dir}")
+            if failures:
+                self.logger.error(
+                    f"Failed to delete {len(failures)} files: {'; '.join(failures[:10])}"
+                )
         except Exception as e:
             self.logger.error(f"Download cleanup failed: {e}")
 
+    @staticmethod
+    def _unlink_quietly(path: str) -> Optional[str]:
+        """
+        Delete a file, reporting failure instead of raising
+        
+        :param path: File to delete
+        :return: Error description, or None on success
+        """
+        try:
+            os.unlink(path)
+            return None
+        except OSError as e:
+            return f"{path}: {e}"
+
+    def _iter_files(self, path: str) -> Iterator[os.DirEntry]:
+        """
+        Recursively yield file entries below a directory
+        
+        :param path: Directory to walk
+        :return: Iterator of directory entries for regular files
+        """
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._iter_files(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
     def validate_username(self, username: str) -> bool:
         """
         Validate Instagram username
@@ -244,17 +500,8 @@ class InstagramService:
         :return: Validity of username
         """
         try:
-            # Username regex pattern
-            username_pattern = r'^[a-zA-Z0-9._]+$'
-            
-            # Check username length and pattern
-            if not re.match(username_pattern, username):
-                return False
-            
-            if len(username) < 3 or len(username) > 30:
-                return False
-            
-            return True
+            # Check username length and pattern in one match
+            return _USERNAME_RE.fullmatch(username) is not None
         except Exception as e:
             self.logger.error(f"Username validation error: {e}")
             return False
@@ -268,7 +515,7 @@ class InstagramService:
         """
         try:
             # Attempt to load profile
-            instaloader.Profile.from_username(self.loader.context, username)
+            self._get_profile(username)
             return True
         except instaloader.exceptions.ProfileNotFoundError:
             return False
@@ -284,7 +531,7 @@ class InstagramService:
         :return: Profile metadata dictionary
         """
         try:
-            profile = instaloader.Profile.from_username(self.loader.context, username)
+            profile = self._get_profile(username)
             
             metadata = {
                 'username': profile.username,
@@ -304,5 +551,47 @@ class InstagramService:
             self.logger.error(f"Profile metadata retrieval failed: {e}")
             return None
 
+    def shutdown(self):
+        """
+        Perform cleanup and shutdown for the service
+        """
+        self.logger.info("Instagram service shutting down")
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker threads used by the async wrappers and release pooled connections
+        """
+        self._close_aio_session()
+        self._executor.shutdown(wait=True)
+        self._http.close()
+
+    def _close_aio_session(self):
+        """
+        Close the shared aiohttp session from synchronous code
+        """
+        session, loop = self._aio_session, self._aio_loop
+        if session is None or session.closed:
+            return
+        
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        try:
+            if loop.is_closed() or (running is not None and running is not loop and not loop.is_running()):
+                # The owning loop cannot be driven from here; drop the pooled connections directly
+                session.connector.close()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(session.close(), loop)
+                # Waiting from the loop's own thread would deadlock
+                if running is not loop:
+                    future.result(timeout=5)
+            else:
+                loop.run_until_complete(session.close())
+        except Exception as e:
+            self.logger.error(f"HTTP session close error: {e}")
+
 # Create a singleton instance
 instagram_service = InstagramService()
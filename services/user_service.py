@@ -1,14 +1,27 @@
 import os
-import json
 import logging
-from typing import Dict, Any, Optional, List
+from collections import Counter
+from threading import Lock
+from typing import Dict, Any, Optional, List, Tuple, Union
 from datetime import datetime, timedelta
+import orjson
+from cachetools import TTLCache
+from sqlalchemy import select, text, update
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
-from database.database import db_manager
+from database.database import db_manager, upsert, with_session
 from database.models import User, InstagramCredential, DownloadHistory
+from utils import BatchBuffer
 from utils.security import security_manager
 from config.settings import settings
 
+# Telegram ID -> users.id, shared by all sessions to skip repeat lookups
+_user_id_cache = TTLCache(maxsize=10_000, ttl=300)
+_user_id_cache_lock = Lock()
+
+# Liveness probe statement, built once
+_PING = text('SELECT 1')
+
 class UserService:
     def __init__(self):
         """
@@ -17,6 +30,15 @@ class UserService:
         self.logger = logging.getLogger(__name__)
         self.max_login_attempts = 3
         self.block_duration = timedelta(minutes=30)
+        
+        # Download history rows waiting to be written in one transaction
+        self._history_buffer = BatchBuffer(self.bulk_log_downloads, batch_size=50, interval=1.0)
+        
+        # Expired blocks waiting to be cleared in one UPDATE
+        self._unblock_buffer = BatchBuffer(self._clear_expired_blocks, batch_size=50, interval=1.0)
+        
+        # Export directory, created on first export
+        self._export_dir = None
 
     def initialize(self, **kwargs):
         """
@@ -70,23 +92,21 @@ class UserService:
             self.logger.error(f"User creation error: {e}")
             raise
 
-    def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
+    @with_session("User retrieval error", default=None)
+    def get_user_by_telegram_id(self, session: Session, telegram_id: int) -> Optional[User]:
         """
         Retrieve user by Telegram ID
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: User object or None
         """
-        try:
-            with db_manager.get_session() as session:
-                return session.query(User).filter_by(telegram_id=telegram_id).first()
-        
-        except Exception as e:
-            self.logger.error(f"User retrieval error: {e}")
-            return None
+        return session.query(User).filter_by(telegram_id=telegram_id).first()
 
+    @with_session("Credential update error", default=False)
     def update_instagram_credentials(
         self, 
+        session: Session, 
         telegram_id: int, 
         username: str, 
         encrypted_username: str = None, 
@@ -95,116 +115,116 @@ class UserService:
         """
         Update Instagram credentials for a user
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :param username: Instagram username
         :param encrypted_username: Encrypted username
         :param encrypted_password: Encrypted password
         :return: Update status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    self.logger.warning(f"User not found: {telegram_id}")
-                    return False
-                
-                # Update Instagram username
-                user.instagram_username = username
-                user.is_authenticated = True
-                user.last_login = datetime.utcnow()
-                
-                # Create or update credentials
-                credential = session.query(InstagramCredential).filter_by(user_id=user.id).first()
-                
-                if credential:
-                    if encrypted_username:
-                        credential.encrypted_username = encrypted_username
-                    if encrypted_password:
-                        credential.encrypted_password = encrypted_password
-                else:
-                    credential = InstagramCredential(
-                        user_id=user.id,
-                        encrypted_username=encrypted_username or '',
-                        encrypted_password=encrypted_password or ''
-                    )
-                    session.add(credential)
-                
-                session.commit()
-                self.logger.info(f"Instagram credentials updated for user: {telegram_id}")
-                return True
+        user_id = self._resolve_user_id(session, telegram_id)
         
-        except Exception as e:
-            self.logger.error(f"Credential update error: {e}")
+        if user_id is None:
+            self.logger.warning(f"User not found: {telegram_id}")
             return False
+        
+        # Update Instagram username
+        updated = session.query(User).filter_by(id=user_id).update(
+            {
+                User.instagram_username: username,
+                User.is_authenticated: True,
+                User.last_login: datetime.utcnow()
+            },
+            synchronize_session=False
+        )
+        
+        if not updated:
+            self._invalidate_user_id(telegram_id)
+            self.logger.warning(f"User not found: {telegram_id}")
+            return False
+        
+        # Create or update credentials in a single statement
+        update_values = {}
+        if encrypted_username:
+            update_values['encrypted_username'] = encrypted_username
+        if encrypted_password:
+            update_values['encrypted_password'] = encrypted_password
+        
+        upsert(
+            session,
+            InstagramCredential,
+            {
+                'user_id': user_id,
+                'encrypted_username': encrypted_username or '',
+                'encrypted_password': encrypted_password or ''
+            },
+            index_elements=['user_id'],
+            update_values=update_values
+        )
+        
+        self.logger.info(f"Instagram credentials updated for user: {telegram_id}")
+        return True
 
-    def remove_instagram_credentials(self, telegram_id: int) -> bool:
+    @with_session("Credential removal error", default=False)
+    def remove_instagram_credentials(self, session: Session, telegram_id: int) -> bool:
         """
         Remove Instagram credentials for a user
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: Removal status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Remove credentials
-                session.query(InstagramCredential).filter_by(user_id=user.id).delete()
-                
-                # Reset user authentication status
-                user.instagram_username = None
-                user.is_authenticated = False
-                
-                session.commit()
-                self.logger.info(f"Instagram credentials removed for user: {telegram_id}")
-                return True
+        user_id = self._resolve_user_id(session, telegram_id)
         
-        except Exception as e:
-            self.logger.error(f"Credential removal error: {e}")
+        if user_id is None:
             return False
+        
+        # Remove credentials
+        session.query(InstagramCredential).filter_by(user_id=user_id).delete()
+        
+        # Reset user authentication status
+        session.query(User).filter_by(id=user_id).update(
+            {User.instagram_username: None, User.is_authenticated: False},
+            synchronize_session=False
+        )
+        
+        self.logger.info(f"Instagram credentials removed for user: {telegram_id}")
+        return True
 
+    @with_session("Password update error", default=False)
     def update_instagram_password(
         self, 
+        session: Session, 
         telegram_id: int, 
         new_password: str
     ) -> bool:
         """
         Update Instagram account password
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :param new_password: New password
         :return: Update status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Find user credentials
-                credential = session.query(InstagramCredential).filter_by(user_id=user.id).first()
-                
-                if not credential:
-                    return False
-                
-                # Encrypt new password
-                encrypted_password = security_manager.encrypt_data(new_password)
-                
-                # Update credential
-                credential.encrypted_password = encrypted_password['encrypted_data']
-                
-                session.commit()
-                self.logger.info(f"Password updated for user: {telegram_id}")
-                return True
+        user_id = self._resolve_user_id(session, telegram_id)
         
-        except Exception as e:
-            self.logger.error(f"Password update error: {e}")
+        if user_id is None:
+            return False
+        
+        # Encrypt new password
+        encrypted_password = security_manager.encrypt_data(new_password)
+        
+        # Update credential in place; no row means no stored credentials
+        updated = session.query(InstagramCredential).filter_by(user_id=user_id).update(
+            {InstagramCredential.encrypted_password: security_manager.as_text(encrypted_password['encrypted_data'])},
+            synchronize_session=False
+        )
+        
+        if not updated:
             return False
+        
+        self.logger.info(f"Password updated for user: {telegram_id}")
+        return True
 
     def log_download(
         self, 
@@ -213,122 +233,176 @@ class UserService:
         media_url: str
     ) -> bool:
         """
-        Log user download activity
+        Queue user download activity for a batched database write
         
         :param telegram_id: Telegram user ID
         :param media_type: Type of media downloaded
         :param media_url: URL or path of downloaded media
         :return: Logging status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Create download history entry
-                download_history = DownloadHistory(
-                    user_id=user.id,
-                    media_type=media_type,
-                    media_url=media_url
-                )
-                
-                # Increment download count
-                user.download_count += 1
-                
-                session.add(download_history)
-                session.commit()
-                
-                return True
+        self._history_buffer.add((telegram_id, media_type, media_url))
+        return True
+
+    def log_download_by_username(
+        self, 
+        instagram_username: str, 
+        media_type: str, 
+        media_url: str
+    ) -> bool:
+        """
+        Queue download activity for the user linked to an Instagram account
         
-        except Exception as e:
-            self.logger.error(f"Download logging error: {e}")
-            return False
+        :param instagram_username: Linked Instagram username
+        :param media_type: Type of media downloaded
+        :param media_url: URL or path of downloaded media
+        :return: Logging status
+        """
+        self._history_buffer.add((instagram_username, media_type, media_url))
+        return True
+
+    @with_session("Bulk download logging error", default=False)
+    def bulk_log_downloads(self, session: Session, entries: List[Tuple[Union[int, str], str, str]]) -> bool:
+        """
+        Log several download activities in a single transaction
+        
+        :param session: Active database session
+        :param entries: (telegram_id or instagram_username, media_type, media_url) tuples
+        :return: Logging status
+        """
+        telegram_ids = {key for key, _, _ in entries if isinstance(key, int)}
+        usernames = {key for key, _, _ in entries if isinstance(key, str)}
+        
+        user_ids = {}
+        if telegram_ids:
+            user_ids.update(
+                session.query(User.telegram_id, User.id)
+                .filter(User.telegram_id.in_(telegram_ids))
+            )
+        if usernames:
+            # Several accounts may link the same username; keep the first match
+            for username, user_id in (
+                session.query(User.instagram_username, User.id)
+                .filter(User.instagram_username.in_(usernames))
+                .order_by(User.id)
+            ):
+                user_ids.setdefault(username, user_id)
+        
+        # Build download history rows for known users
+        history_rows = []
+        download_counts = Counter()
+        for key, media_type, media_url in entries:
+            user_id = user_ids.get(key)
+            if user_id is None:
+                continue
+            
+            history_rows.append({
+                'user_id': user_id,
+                'media_type': media_type,
+                'media_url': media_url
+            })
+            download_counts[user_id] += 1
+        
+        session.bulk_insert_mappings(DownloadHistory, history_rows)
+        
+        # Increment download counts in place
+        for user_id, count in download_counts.items():
+            session.query(User).filter_by(id=user_id).update(
+                {User.download_count: User.download_count + count},
+                synchronize_session=False
+            )
+        
+        return True
 
-        def reset_user_download_history(self, telegram_id: int) -> bool:
+    @with_session("Download history reset error", default=False)
+    def reset_user_download_history(self, session: Session, telegram_id: int) -> bool:
         """
         Reset user's download history
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: Reset status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Delete all download history entries for the user
-                session.query(DownloadHistory).filter_by(user_id=user.id).delete()
-                
-                # Reset download count
-                user.download_count = 0
-                
-                session.commit()
-                
-                self.logger.info(f"Download history reset for user: {telegram_id}")
-                return True
+        user_id = self._resolve_user_id(session, telegram_id)
         
-        except Exception as e:
-            self.logger.error(f"Download history reset error: {e}")
+        if user_id is None:
             return False
+        
+        # Delete all download history entries for the user
+        session.query(DownloadHistory).filter_by(user_id=user_id).delete()
+        
+        # Reset download count
+        session.query(User).filter_by(id=user_id).update(
+            {User.download_count: 0},
+            synchronize_session=False
+        )
+        
+        self.logger.info(f"Download history reset for user: {telegram_id}")
+        return True
 
-    def export_user_data(self, telegram_id: int) -> Optional[str]:
+    @with_session("User data export error", default=None)
+    def export_user_data(self, session: Session, telegram_id: int) -> Optional[str]:
         """
         Export user data to a JSON file
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: Path to exported data file
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return None
-                
-                # Collect user data
-                user_data = {
-                    'user_info': {
-                        'telegram_id': user.telegram_id,
-                        'instagram_username': user.instagram_username,
-                        'is_authenticated': user.is_authenticated,
-                        'last_login': user.last_login.isoformat() if user.last_login else None,
-                        'download_count': user.download_count
-                    },
-                    'download_history': []
-                }
-                
-                # Fetch download history
-                download_history = session.query(DownloadHistory).filter_by(user_id=user.id).all()
-                
-                for entry in download_history:
-                    user_data['download_history'].append({
-                        'media_type': entry.media_type,
-                        'media_url': entry.media_url,
-                        'download_time': entry.download_time.isoformat()
-                    })
-                
-                # Create export directory
-                export_dir = settings.BASE_DIR / 'exports'
-                export_dir.mkdir(parents=True, exist_ok=True)
-                
-                # Generate export filename
-                export_filename = f"user_data_{telegram_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                export_path = export_dir / export_filename
-                
-                # Write data to file
-                with open(export_path, 'w') as f:
-                    json.dump(user_data, f, indent=2)
-                
-                self.logger.info(f"User data exported: {export_path}")
-                return str(export_path)
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
         
-        except Exception as e:
-            self.logger.error(f"User data export error: {e}")
+        if not user:
             return None
+        
+        # Collect user data
+        user_info = {
+            'telegram_id': user.telegram_id,
+            'instagram_username': user.instagram_username,
+            'is_authenticated': user.is_authenticated,
+            'last_login': user.last_login,
+            'download_count': user.download_count
+        }
+        
+        # Create export directory once
+        if self._export_dir is None:
+            export_dir = settings.BASE_DIR / 'exports'
+            export_dir.mkdir(parents=True, exist_ok=True)
+            self._export_dir = export_dir
+        export_dir = self._export_dir
+        
+        # Generate export filename
+        export_filename = f"user_data_{telegram_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        export_path = export_dir / export_filename
+        
+        # Stream download history through a server-side cursor
+        download_history = session.execute(
+            select(
+                DownloadHistory.media_type,
+                DownloadHistory.media_url,
+                DownloadHistory.download_time
+            )
+            .where(DownloadHistory.user_id == user.id)
+            .execution_options(stream_results=True, yield_per=1000)
+        )
+        
+        # Stream data to file one history entry at a time
+        with open(export_path, 'wb') as f:
+            f.write(b'{"user_info":')
+            f.write(orjson.dumps(user_info))
+            f.write(b',"download_history":[')
+            
+            for index, (media_type, media_url, download_time) in enumerate(download_history):
+                if index:
+                    f.write(b',')
+                f.write(orjson.dumps({
+                    'media_type': media_type,
+                    'media_url': media_url,
+                    'download_time': download_time
+                }))
+            
+            f.write(b']}')
+        
+        self.logger.info(f"User data exported: {export_path}")
+        return str(export_path)
 
     def delete_user_account(self, telegram_id: int) -> bool:
         """
@@ -337,114 +411,159 @@ class UserService:
         :param telegram_id: Telegram user ID
         :return: Deletion status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Delete related records
-                # 1. Delete download history
-                session.query(DownloadHistory).filter_by(user_id=user.id).delete()
-                
-                # 2. Delete Instagram credentials
-                session.query(InstagramCredential).filter_by(user_id=user.id).delete()
-                
-                # 3. Delete user
-                session.delete(user)
-                
-                session.commit()
-                
-                self.logger.info(f"User account deleted: {telegram_id}")
-                return True
+        deleted = self._delete_user_rows(telegram_id)
         
-        except Exception as e:
-            self.logger.error(f"User account deletion error: {e}")
+        # Only forget the cached ID once the deletion is committed, so a
+        # concurrent lookup cannot re-cache it from the uncommitted row
+        if deleted:
+            self._invalidate_user_id(telegram_id)
+            self.logger.info(f"User account deleted: {telegram_id}")
+        return deleted
+
+    @with_session("User account deletion error", default=False)
+    def _delete_user_rows(self, session: Session, telegram_id: int) -> bool:
+        """
+        Delete a user and associated records in one transaction
+        
+        :param session: Active database session
+        :param telegram_id: Telegram user ID
+        :return: Whether the user existed
+        """
+        user_id = self._resolve_user_id(session, telegram_id)
+        
+        if user_id is None:
             return False
+        
+        # Delete related records
+        # 1. Delete download history
+        session.query(DownloadHistory).filter_by(user_id=user_id).delete()
+        
+        # 2. Delete Instagram credentials
+        session.query(InstagramCredential).filter_by(user_id=user_id).delete()
+        
+        # 3. Delete user
+        session.query(User).filter_by(id=user_id).delete()
+        return True
 
-    def block_user(self, telegram_id: int, duration: Optional[timedelta] = None) -> bool:
+    @with_session("User blocking error", default=False)
+    def block_user(self, session: Session, telegram_id: int, duration: Optional[timedelta] = None) -> bool:
         """
         Block user account temporarily
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :param duration: Block duration (default: 30 minutes)
         :return: Blocking status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Set block details
-                user.is_blocked = True
-                user.block_until = datetime.utcnow() + (duration or self.block_duration)
-                
-                session.commit()
-                
-                self.logger.warning(f"User blocked: {telegram_id}")
-                return True
+        # Set block details in a single statement
+        result = session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(
+                is_blocked=True,
+                block_until=datetime.utcnow() + (duration or self.block_duration)
+            )
+        )
         
-        except Exception as e:
-            self.logger.error(f"User blocking error: {e}")
+        if not result.rowcount:
             return False
+        
+        self.logger.warning(f"User blocked: {telegram_id}")
+        return True
 
-    def unblock_user(self, telegram_id: int) -> bool:
+    @with_session("User unblocking error", default=False)
+    def unblock_user(self, session: Session, telegram_id: int) -> bool:
         """
         Unblock user account
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: Unblocking status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user:
-                    return False
-                
-                # Remove block details
-                user.is_blocked = False
-                user.block_until = None
-                
-                session.commit()
-                
-                self.logger.info(f"User unblocked: {telegram_id}")
-                return True
+        # Remove block details in a single statement
+        result = session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(is_blocked=False, block_until=None)
+        )
         
-        except Exception as e:
-            self.logger.error(f"User unblocking error: {e}")
+        if not result.rowcount:
             return False
+        
+        self.logger.info(f"User unblocked: {telegram_id}")
+        return True
 
-    def is_user_blocked(self, telegram_id: int) -> bool:
+    @with_session("User blocking status check error", default=False)
+    def is_user_blocked(self, session: Session, telegram_id: int) -> bool:
         """
         Check if user is currently blocked
         
+        :param session: Active database session
         :param telegram_id: Telegram user ID
         :return: Blocking status
         """
-        try:
-            with db_manager.get_session() as session:
-                user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                
-                if not user or not user.is_blocked:
-                    return False
-                
-                # Check if block duration has expired
-                if user.block_until and user.block_until < datetime.utcnow():
-                    # Automatically unblock if duration has passed
-                    user.is_blocked = False
-                    user.block_until = None
-                    session.commit()
-                    return False
-                
-                return user.is_blocked
+        row = session.execute(
+            select(User.is_blocked, User.block_until)
+            .where(User.telegram_id == telegram_id)
+        ).first()
         
-        except Exception as e:
-            self.logger.error(f"User blocking status check error: {e}")
+        if row is None or not row.is_blocked:
+            return False
+        
+        # Check if block duration has expired
+        if row.block_until and row.block_until < datetime.utcnow():
+            # Clear the expired block in the background
+            self._unblock_buffer.add(telegram_id)
             return False
+        
+        return True
+
+    @with_session("Expired block clearing error", default=None)
+    def _clear_expired_blocks(self, session: Session, telegram_ids: List[int]):
+        """
+        Clear expired blocks for a batch of users in a single UPDATE
+        
+        :param session: Active database session
+        :param telegram_ids: Telegram user IDs whose block has expired
+        """
+        # Re-check expiry so a block issued since the check is kept
+        session.execute(
+            update(User)
+            .where(
+                User.telegram_id.in_(set(telegram_ids)),
+                User.block_until < datetime.utcnow()
+            )
+            .values(is_blocked=False, block_until=None)
+        )
+
+    def _resolve_user_id(self, session, telegram_id: int) -> Optional[int]:
+        """
+        Resolve a Telegram ID to a user primary key, using the shared cache
+        
+        :param session: Active database session
+        :param telegram_id: Telegram user ID
+        :return: User ID or None if the user does not exist
+        """
+        with _user_id_cache_lock:
+            user_id = _user_id_cache.get(telegram_id)
+        
+        if user_id is None:
+            user_id = session.query(User.id).filter_by(telegram_id=telegram_id).scalar()
+            
+            if user_id is not None:
+                with _user_id_cache_lock:
+                    _user_id_cache[telegram_id] = user_id
+        
+        return user_id
+
+    def _invalidate_user_id(self, telegram_id: int):
+        """
+        Drop a cached Telegram ID to user ID mapping
+        
+        :param telegram_id: Telegram user ID
+        """
+        with _user_id_cache_lock:
+            _user_id_cache.pop(telegram_id, None)
 
     def health_check(self) -> bool:
         """
@@ -453,9 +572,9 @@ class UserService:
         :return: Service health status
         """
         try:
-            # Perform a simple database connection test
-            with db_manager.get_session() as session:
-                session.execute('SELECT 1')
+            # Perform a simple database connection test without an ORM session
+            with db_manager.engine.connect() as connection:
+                connection.execute(_PING)
             
             return True
         
@@ -468,7 +587,8 @@ class UserService:
         Perform cleanup and shutdown for the service
         """
         self.logger.info("User service shutting down")
-        # Additional cleanup logic if needed
+        self._history_buffer.close()
+        self._unblock_buffer.close()
 
 # Create a singleton instance
 user_service = UserService()
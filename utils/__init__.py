@@ -8,24 +8,30 @@ and common helper methods used across the application.
 import functools
 import time
 import logging
+from collections import deque
 from typing import Any, Callable, Dict, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from threading import Event, Lock, Thread
 from contextlib import contextmanager
+from cachetools import LFUCache, cached
+
+# Separates positional from keyword arguments in memoize keys
+_KWARGS_MARK = object()
 
 class Utilities:
     """
     Centralized utility class for common application-wide functions
     """
     
-    def __init__(self):
+    def __init__(self, cache_maxsize: int = 1024):
         """
         Initialize utility services
+        
+        :param cache_maxsize: Maximum number of memoized results kept
         """
         self.logger = logging.getLogger(__name__)
         self._thread_pool = ThreadPoolExecutor(max_workers=10)
-        self._cache = {}
-        self._cache_lock = Lock()
+        self.cache_maxsize = cache_maxsize
 
     def retry(
         self, 
@@ -46,20 +52,29 @@ class Utilities:
         def decorator(func):
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
+                # Fast path: most calls succeed on the first attempt
+                try:
+                    return func(*args, **kwargs)
+                except exceptions as e:
+                    if max_attempts <= 1:
+                        raise
+                    error = e
+                
                 current_delay = delay
-                for attempt in range(1, max_attempts + 1):
+                for attempt in range(1, max_attempts):
+                    self.logger.warning(
+                        f"Retry attempt {attempt} for {func.__name__}: {error}"
+                    )
+                    
+                    time.sleep(current_delay)
+                    current_delay *= backoff
+                    
                     try:
                         return func(*args, **kwargs)
                     except exceptions as e:
-                        if attempt == max_attempts:
+                        if attempt + 1 == max_attempts:
                             raise
-                        
-                        self.logger.warning(
-                            f"Retry attempt {attempt} for {func.__name__}: {e}"
-                        )
-                        
-                        time.sleep(current_delay)
-                        current_delay *= backoff
+                        error = e
             return wrapper
         return decorator
 
@@ -76,19 +91,28 @@ class Utilities:
         :return: Decorated function
         """
         def decorator(func):
-            calls = []
+            calls = deque()
+            calls_lock = Lock()
+            
+            # Bound once so each call avoids attribute lookups
+            monotonic = time.monotonic
+            popleft = calls.popleft
+            append = calls.append
             
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                current_time = time.time()
-                
-                # Remove old calls outside the period
-                calls[:] = [call for call in calls if current_time - call < period]
-                
-                if len(calls) >= max_calls:
-                    raise RuntimeError("Rate limit exceeded")
+                with calls_lock:
+                    current_time = monotonic()
+                    
+                    # Drop calls that slid out of the period
+                    while calls and current_time - calls[0] >= period:
+                        popleft()
+                    
+                    if len(calls) >= max_calls:
+                        raise RuntimeError("Rate limit exceeded")
+                    
+                    append(current_time)
                 
-                calls.append(current_time)
                 return func(*args, **kwargs)
             
             return wrapper
@@ -96,66 +120,143 @@ class Utilities:
 
     def memoize(
         self, 
-        timeout: Optional[float] = None
+        timeout: Optional[float] = None,
+        maxsize: Optional[int] = None,
+        policy: str = 'lru'
     ):
         """
         Decorator for caching function results
         
-        :param timeout: Cache expiration time
+        With the default ``lru`` policy this is ``functools.lru_cache``, or a
+        bounded, approximately LRU cache with per-entry expiry when a timeout
+        is given. The ``lfu`` policy
+        evicts the least frequently used result instead, so bursts of one-off
+        calls do not push out hot entries. Each decorated function gets its
+        own cache; calls with unhashable arguments run uncached.
+        
+        :param timeout: Cache expiration time, only supported with ``lru``
+        :param maxsize: Maximum number of cached results, defaults to ``cache_maxsize``
+        :param policy: Eviction policy, ``lru`` or ``lfu``
         :return: Decorated function
         """
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown memoize policy: {policy}")
+        if policy == 'lfu' and timeout is not None:
+            raise ValueError("Timeouts are only supported with the lru policy")
+        
+        if maxsize is None:
+            maxsize = self.cache_maxsize
+        
         def decorator(func):
+            def bypass_unhashable(cached_func):
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    try:
+                        hash((args, tuple(kwargs.values())))
+                    except TypeError:
+                        # Unhashable arguments cannot be cached
+                        return func(*args, **kwargs)
+                    return cached_func(*args, **kwargs)
+                return wrapper
+            
+            if policy == 'lfu':
+                # Hits update use counts, so lookups are locked too
+                cache = LFUCache(maxsize=maxsize)
+                wrapper = bypass_unhashable(cached(cache, lock=Lock())(func))
+                wrapper.cache = cache
+                return wrapper
+            
+            if timeout is None:
+                cached_func = functools.lru_cache(maxsize=maxsize)(func)
+                wrapper = bypass_unhashable(cached_func)
+                wrapper.cache_info = cached_func.cache_info
+                wrapper.cache_clear = cached_func.cache_clear
+                return wrapper
+            
+            # key -> (result, expiry) in recency order; lookups never mutate
+            # the dict, and every mutation happens under cache_lock
+            cache = {}
+            cache_lock = Lock()
+            
+            # Bound once so each call avoids attribute lookups
+            cache_get = cache.get
+            monotonic = time.monotonic
+            
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                # Create a hashable key from arguments
-                key = str(args) + str(kwargs)
+                # Same key shape as cachetools' hashkey, built inline to save a call
+                key = (args + (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))) if kwargs else args
                 
-                with self._cache_lock:
-                    # Check if result is in cache and not expired
-                    if key in self._cache:
-                        result, timestamp = self._cache[key]
-                        
-                        if timeout is None or time.time() - timestamp < timeout:
-                            return result
-                    
-                    # Compute and cache result
-                    result = func(*args, **kwargs)
-                    self._cache[key] = (result, time.time())
+                try:
+                    entry = cache_get(key)
+                except TypeError:
+                    # Unhashable arguments cannot be cached
+                    return func(*args, **kwargs)
+                if entry is not None and entry[1] > monotonic():
+                    # Move the hit to the recent end when the lock is free;
+                    # under contention recency updates are skipped, never waited on
+                    if cache_lock.acquire(blocking=False):
+                        try:
+                            if key in cache:
+                                cache[key] = cache.pop(key)
+                        finally:
+                            cache_lock.release()
+                    return entry[0]
                 
+                result = func(*args, **kwargs)
+                with cache_lock:
+                    now = monotonic()
+                    cache.pop(key, None)
+                    cache[key] = (result, now + timeout)
+                    
+                    # Evict least recently used entries over capacity, and
+                    # expired ones as they reach the front
+                    while cache and (len(cache) > maxsize or next(iter(cache.values()))[1] <= now):
+                        del cache[next(iter(cache))]
                 return result
             
+            wrapper.cache = cache
             return wrapper
         return decorator
 
     def run_parallel(
         self, 
         functions: list, 
-        max_workers: int = 5
+        max_workers: Optional[int] = None,
+        executor: Optional[ThreadPoolExecutor] = None
     ) -> Dict[Callable, Any]:
         """
         Execute multiple functions in parallel
         
+        Work runs on the shared utility thread pool unless an executor or a
+        dedicated worker count is given.
+        
         :param functions: List of functions to execute
-        :param max_workers: Maximum number of concurrent workers
+        :param max_workers: Run on a dedicated pool of this many workers
+        :param executor: Executor to run the functions on
         :return: Dictionary of function results
         """
+        if executor is None and max_workers is not None:
+            with ThreadPoolExecutor(max_workers=max_workers) as dedicated:
+                return self.run_parallel(functions, executor=dedicated)
+        
+        executor = executor or self._thread_pool
         results = {}
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all functions to executor
-            futures = {
-                executor.submit(func): func 
-                for func in functions
-            }
-            
-            # Collect results as they complete
-            for future in as_completed(futures):
-                func = futures[future]
-                try:
-                    results[func] = future.result()
-                except Exception as e:
-                    self.logger.error(f"Parallel execution error for {func.__name__}: {e}")
-                    results[func] = None
+        # Submit all functions to executor
+        futures = {
+            executor.submit(func): func 
+            for func in functions
+        }
+        
+        # Collect results as they complete
+        for future in as_completed(futures):
+            func = futures[future]
+            try:
+                results[func] = future.result()
+            except Exception as e:
+                self.logger.error(f"Parallel execution error for {func.__name__}: {e}")
+                results[func] = None
         
         return results
 
@@ -167,11 +268,11 @@ class Utilities:
         :param label: Label for the timed operation
         :yield: Timing context
         """
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         yield
-        end_time = time.time()
+        elapsed = (time.perf_counter_ns() - start_time) / 1e9
         
-        self.logger.info(f"{label} took {end_time - start_time:.4f} seconds")
+        self.logger.info(f"{label} took {elapsed:.4f} seconds")
 
     def validate_input(
         self, 
@@ -232,19 +333,100 @@ class Utilities:
         :param func: Function to log
         :return: Function result
         """
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         result = func(*args, **kwargs)
-        end_time = time.time()
+        elapsed = (time.perf_counter_ns() - start_time) / 1e9
         
         self.logger.info(
             f"Function: {func.__name__}, "
-            f"Execution Time: {end_time - start_time:.4f} seconds"
+            f"Execution Time: {elapsed:.4f} seconds"
         )
         
         return result
 
+class BatchBuffer:
+    """
+    Thread-safe buffer that hands items to a flush callback in batches
+    """
+
+    def __init__(
+        self, 
+        flush_func: Callable[[list], Any], 
+        batch_size: int = 50, 
+        interval: float = 1.0
+    ):
+        """
+        Initialize batch buffer
+        
+        :param flush_func: Callable receiving a list of buffered items
+        :param batch_size: Number of items that triggers an early flush
+        :param interval: Maximum seconds an item waits before being flushed
+        """
+        self.logger = logging.getLogger(__name__)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._flush_func = flush_func
+        self._items: list = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = False
+        self._worker: Optional[Thread] = None
+
+    def add(self, item: Any):
+        """
+        Buffer an item, starting the background flusher on first use
+        
+        :param item: Item to buffer
+        """
+        with self._lock:
+            self._items.append(item)
+            full = len(self._items) >= self.batch_size
+
+            if self._worker is None and not self._stopped:
+                self._worker = Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+        if self._stopped:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Hand all buffered items to the flush callback
+        """
+        with self._lock:
+            batch, self._items = self._items, []
+
+        if batch:
+            try:
+                self._flush_func(batch)
+            except Exception as e:
+                self.logger.error(f"Batch flush error: {e}")
+
+    def close(self):
+        """
+        Stop the background flusher and flush remaining items
+        """
+        self._stopped = True
+        self._wakeup.set()
+
+        if self._worker is not None:
+            self._worker.join()
+
+        self.flush()
+
+    def _run(self):
+        """
+        Flush periodically, or early when a batch fills up
+        """
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
 # Create a singleton instance
 utils = Utilities()
 
 # Export utility functions and class
-__all__ = ['utils']
+__all__ = ['utils', 'BatchBuffer']
@@ -1,19 +1,103 @@
 import os
+import asyncio
 import hashlib
+import hmac
 import secrets
+import functools
+import string
 from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import base64
 import bcrypt
 import jwt
-from datetime import datetime, timedelta
-import re
 import ipaddress
 import logging
+import time
+import weakref
+from threading import Lock
+from cachetools import LRUCache, TLRUCache
+from utils import utils
+
+# scrypt cost parameters: ~16 MB of memory per derivation
+_SCRYPT_N = 2 ** 14
+_SCRYPT_R = 8
+_SCRYPT_P = 1
+
+# Upper bound on how long a validated JWT is trusted without re-checking
+_JWT_CACHE_TTL = 60
+
+# Derived keys for caller-supplied salts, keyed by a keyed digest of the
+# password so plaintext passwords are never held as cache keys
+_derived_keys = LRUCache(maxsize=128)
+_derived_keys_lock = Lock()
+_DIGEST_KEY = os.urandom(32)
+
+def _derive_key(password: bytes, salt: bytes) -> bytes:
+    """
+    Derive a 256-bit key with scrypt
+    
+    :param password: Password bytes
+    :param salt: Salt bytes
+    :return: URL-safe base64 encoded key
+    """
+    key = hashlib.scrypt(
+        password,
+        salt=salt,
+        n=_SCRYPT_N,
+        r=_SCRYPT_R,
+        p=_SCRYPT_P,
+        maxmem=2 * 128 * _SCRYPT_N * _SCRYPT_R,
+        dklen=32
+    )
+    return base64.urlsafe_b64encode(key)
+
+def _derive_key_cached(password: bytes, salt: bytes) -> bytes:
+    """
+    Derive a key with scrypt, reusing earlier results for the same password and salt
+    
+    :param password: Password bytes
+    :param salt: Salt bytes
+    :return: URL-safe base64 encoded key
+    """
+    cache_key = (hmac.new(_DIGEST_KEY, password, hashlib.sha256).digest(), salt)
+    with _derived_keys_lock:
+        key = _derived_keys.get(cache_key)
+    
+    if key is None:
+        key = _derive_key(password, salt)
+        with _derived_keys_lock:
+            _derived_keys[cache_key] = key
+    return key
+
+# Character sets accepted in email addresses
+_EMAIL_TLD_CHARS = frozenset(string.ascii_letters)
+_EMAIL_DOMAIN_CHARS = _EMAIL_TLD_CHARS | frozenset(string.digits + '.-')
+_EMAIL_LOCAL_CHARS = _EMAIL_DOMAIN_CHARS | frozenset('_%+')
+
+# ASCII digits accepted in IPv4 octets
+_DIGITS = frozenset(string.digits)
+
+# Characters stripped by sanitize_input
+_SANITIZE_TABLE = str.maketrans('', '', '<>&\'"()')
+
+# Managers holding buffered nonces, reset in forked children
+_nonce_buffer_owners = weakref.WeakSet()
+
+def _reset_nonce_buffers():
+    """
+    Drop nonce buffers inherited from the parent process
+    """
+    for manager in list(_nonce_buffer_owners):
+        manager._reset_random_buffer()
+
+os.register_at_fork(after_in_child=_reset_nonce_buffers)
 
 class SecurityManager:
+    # Resolved once; the cryptography backend is process-wide
+    _BACKEND = default_backend()
+
     def __init__(self, secret_key=None, salt=None):
         """
         Initialize security manager with optional secret key and salt
@@ -27,30 +111,70 @@ class SecurityManager:
         
         # Configure logging
         self.logger = logging.getLogger(__name__)
+        
+        # Decoded JWT payloads, expiring at the token's exp or after a minute
+        self._jwt_cache = TLRUCache(
+            maxsize=10_000,
+            ttu=lambda token, payload, now: min(now + _JWT_CACHE_TTL, payload.get('exp', now + _JWT_CACHE_TTL)),
+            timer=time.time
+        )
+        self._jwt_cache_lock = Lock()
+        
+        # Fernet ciphers for recently used keys
+        self._fernet_cache = functools.lru_cache(maxsize=64)(Fernet)
+        
+        # Buffered OS randomness for GCM nonces; keys always come from os.urandom
+        self._rng_chunk = 4096
+        self._rng_buf = b''
+        self._rng_off = 0
+        self._rng_lock = Lock()
+        _nonce_buffer_owners.add(self)
+
+    def _random_bytes(self, length):
+        """
+        Take nonce bytes from a buffer refilled from os.urandom in chunks
+        
+        Only for non-secret nonces. Each byte is handed out once and the
+        buffer is discarded in forked children so parent and child never
+        share nonces.
+        
+        :param length: Number of bytes needed
+        :return: Random bytes
+        """
+        with self._rng_lock:
+            if self._rng_off + length > len(self._rng_buf):
+                self._rng_buf = os.urandom(max(self._rng_chunk, length))
+                self._rng_off = 0
+            start = self._rng_off
+            self._rng_off += length
+            return self._rng_buf[start:self._rng_off]
+
+    def _reset_random_buffer(self):
+        """
+        Drop buffered randomness inherited from the parent process
+        """
+        self._rng_lock = Lock()
+        self._rng_buf = b''
+        self._rng_off = 0
 
     def generate_encryption_key(self, password, salt=None):
         """
-        Generate a secure encryption key using PBKDF2
+        Generate a secure encryption key using scrypt
+        
+        Keys derived for a caller-supplied salt are cached, so repeat
+        derivations skip the memory-hard computation.
         
         :param password: Password to derive key from
         :param salt: Salt for key derivation
         :return: Base64 encoded encryption key
         """
         try:
-            # Use provided salt or generate a new one
-            salt = salt or os.urandom(16)
-            
-            # Key derivation function
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-                backend=default_backend()
-            )
-            
-            # Derive key and encode
-            key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+            # A fresh salt can never repeat, so only supplied salts are cached
+            if salt:
+                key = _derive_key_cached(password.encode(), salt)
+            else:
+                salt = os.urandom(16)
+                key = _derive_key(password.encode(), salt)
             return key, salt
         except Exception as e:
             self.logger.error(f"Key generation error: {e}")
@@ -60,41 +184,199 @@ class SecurityManager:
         """
         Encrypt sensitive data using Fernet symmetric encryption
         
-        :param data: Data to encrypt
+        :param data: Data to encrypt, as str or bytes
         :param key: Optional encryption key
-        :return: Encrypted data
+        :return: Encrypted data and key, both as bytes
         """
         try:
-            # Use provided key or generate a new one
-            encryption_key = key or Fernet.generate_key()
-            cipher = Fernet(encryption_key)
+            # Reuse the cipher for a provided key or generate a new one
+            if key:
+                encryption_key = key
+                cipher = self._fernet_cache(encryption_key)
+            else:
+                encryption_key = Fernet.generate_key()
+                cipher = Fernet(encryption_key)
             
-            # Encrypt data
-            encrypted_data = cipher.encrypt(data.encode())
+            # Encrypt data, passing bytes through untouched
+            if isinstance(data, str):
+                data = data.encode()
             return {
-                'encrypted_data': encrypted_data.decode(),
-                'encryption_key': encryption_key.decode()
+                'encrypted_data': cipher.encrypt(data),
+                'encryption_key': encryption_key
             }
         except Exception as e:
             self.logger.error(f"Encryption error: {e}")
             raise
 
+    @staticmethod
+    def as_text(token):
+        """
+        Text view of a Fernet token or key, for String columns and JSON
+        
+        :param token: URL-safe base64 token as bytes
+        :return: Token as str
+        """
+        return token.decode('ascii') if isinstance(token, bytes) else token
+
+    def encrypt_bulk(self, items, key=None):
+        """
+        Encrypt many values with one key, building the cipher once
+        
+        :param items: Iterable of data to encrypt, as str or bytes
+        :param key: Optional encryption key
+        :return: Encrypted items and the key used, as bytes
+        """
+        try:
+            encryption_key = key or Fernet.generate_key()
+            cipher = self._fernet_cache(encryption_key) if key else Fernet(encryption_key)
+            
+            encrypted_items = [
+                cipher.encrypt(item.encode() if isinstance(item, str) else item)
+                for item in items
+            ]
+            return {
+                'encrypted_data': encrypted_items,
+                'encryption_key': encryption_key
+            }
+        except Exception as e:
+            self.logger.error(f"Bulk encryption error: {e}")
+            raise
+
+    def encrypt_bulk_gcm(self, items, key=None):
+        """
+        Encrypt many values with AES-256-GCM, building the cipher once
+        
+        Each value is sealed on its own as nonce (12 bytes) followed by the
+        ciphertext and tag, so values can be decrypted independently.
+        
+        :param items: Iterable of data to encrypt, as str or bytes
+        :param key: Optional URL-safe base64 encoded 256-bit key
+        :return: Encrypted items and the key used, as bytes
+        """
+        try:
+            encryption_key = key or base64.urlsafe_b64encode(os.urandom(32))
+            cipher = AESGCM(base64.urlsafe_b64decode(encryption_key))
+            
+            encrypted_items = []
+            for item in items:
+                nonce = self._random_bytes(12)
+                sealed = cipher.encrypt(nonce, item.encode() if isinstance(item, str) else item, None)
+                encrypted_items.append(base64.urlsafe_b64encode(nonce + sealed))
+            
+            return {
+                'encrypted_data': encrypted_items,
+                'encryption_key': encryption_key
+            }
+        except Exception as e:
+            self.logger.error(f"Bulk GCM encryption error: {e}")
+            raise
+
+    def decrypt_bulk_gcm(self, encrypted_items, encryption_key):
+        """
+        Decrypt values produced by encrypt_bulk_gcm
+        
+        :param encrypted_items: Iterable of encrypted values
+        :param encryption_key: Key returned by encrypt_bulk_gcm
+        :return: List of decrypted values as bytes
+        """
+        try:
+            cipher = AESGCM(base64.urlsafe_b64decode(encryption_key))
+            
+            decrypted_items = []
+            for item in encrypted_items:
+                sealed = base64.urlsafe_b64decode(item)
+                decrypted_items.append(cipher.decrypt(sealed[:12], sealed[12:], None))
+            return decrypted_items
+        except Exception as e:
+            self.logger.error(f"Bulk GCM decryption error: {e}")
+            raise
+
     def decrypt_data(self, encrypted_data, encryption_key):
         """
         Decrypt sensitive data
         
-        :param encrypted_data: Data to decrypt
+        :param encrypted_data: Data to decrypt, as bytes or str
         :param encryption_key: Key used for decryption
-        :return: Decrypted data
+        :return: Decrypted data as bytes
         """
         try:
-            cipher = Fernet(encryption_key.encode())
-            decrypted_data = cipher.decrypt(encrypted_data.encode()).decode()
-            return decrypted_data
+            cipher = self._fernet_cache(encryption_key)
+            return cipher.decrypt(encrypted_data)
         except Exception as e:
             self.logger.error(f"Decryption error: {e}")
             raise
 
+    def encrypt_file(self, source_path, target_path, key=None, chunk_size=1024 * 1024):
+        """
+        Encrypt a file with AES-256-GCM, streaming it chunk by chunk
+
+        The target file is laid out as nonce (12 bytes), ciphertext and
+        authentication tag (16 bytes), so memory use stays at one chunk.
+
+        :param source_path: Path to the plain file
+        :param target_path: Path to write the encrypted file to
+        :param key: Optional URL-safe base64 encoded 256-bit key
+        :param chunk_size: Number of bytes read per iteration
+        :return: URL-safe base64 encoded encryption key
+        """
+        try:
+            # Use provided key or generate a new one
+            encryption_key = key or base64.urlsafe_b64encode(os.urandom(32))
+            nonce = os.urandom(12)
+            encryptor = Cipher(
+                algorithms.AES(base64.urlsafe_b64decode(encryption_key)),
+                modes.GCM(nonce),
+                backend=self._BACKEND
+            ).encryptor()
+
+            with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+                dst.write(nonce)
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dst.write(encryptor.update(chunk))
+                dst.write(encryptor.finalize())
+                dst.write(encryptor.tag)
+
+            return encryption_key
+        except Exception as e:
+            self.logger.error(f"File encryption error: {e}")
+            raise
+
+    def decrypt_file(self, source_path, target_path, encryption_key, chunk_size=1024 * 1024):
+        """
+        Decrypt a file produced by encrypt_file, streaming it chunk by chunk
+
+        :param source_path: Path to the encrypted file
+        :param target_path: Path to write the decrypted file to
+        :param encryption_key: Key returned by encrypt_file
+        :param chunk_size: Number of bytes read per iteration
+        """
+        try:
+            with open(source_path, 'rb') as src:
+                nonce = src.read(12)
+                src.seek(-16, os.SEEK_END)
+                tag = src.read(16)
+                remaining = src.tell() - 16 - len(nonce)
+                src.seek(len(nonce))
+
+                decryptor = Cipher(
+                    algorithms.AES(base64.urlsafe_b64decode(encryption_key)),
+                    modes.GCM(nonce, tag),
+                    backend=self._BACKEND
+                ).decryptor()
+
+                with open(target_path, 'wb') as dst:
+                    while remaining > 0:
+                        chunk = src.read(min(chunk_size, remaining))
+                        remaining -= len(chunk)
+                        dst.write(decryptor.update(chunk))
+                    dst.write(decryptor.finalize())
+        except Exception as e:
+            # Never leave unauthenticated plaintext behind
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            self.logger.error(f"File decryption error: {e}")
+            raise
+
     def hash_password(self, password):
         """
         Hash password using bcrypt
@@ -128,22 +410,47 @@ class SecurityManager:
             self.logger.error(f"Password verification error: {e}")
             return False
 
+    async def hash_password_async(self, password):
+        """
+        Hash password using bcrypt without blocking the event loop
+        
+        :param password: Plain text password
+        :return: Hashed password
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(utils._thread_pool, self.hash_password, password)
+
+    async def verify_password_async(self, plain_password, hashed_password):
+        """
+        Verify password against stored hash without blocking the event loop
+        
+        :param plain_password: Plain text password
+        :param hashed_password: Stored hashed password
+        :return: Boolean indicating password match
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            utils._thread_pool, self.verify_password, plain_password, hashed_password
+        )
+
     def generate_jwt_token(self, user_id, expiration=None):
         """
         Generate JWT token for authentication
         
         :param user_id: User identifier
-        :param expiration: Token expiration time
+        :param expiration: Token expiration time, as a datetime or Unix timestamp
         :return: JWT token
         """
         try:
+            now = int(time.time())
+            
             # Default expiration: 1 hour
-            expiration = expiration or datetime.utcnow() + timedelta(hours=1)
+            expiration = expiration or now + 3600
             
             payload = {
                 'user_id': user_id,
                 'exp': expiration,
-                'iat': datetime.utcnow()
+                'iat': now
             }
             
             return jwt.encode(payload, self.secret_key, algorithm='HS256')
@@ -158,8 +465,15 @@ class SecurityManager:
         :param token: JWT token to validate
         :return: Decoded token payload
         """
+        with self._jwt_cache_lock:
+            payload = self._jwt_cache.get(token)
+        if payload is not None:
+            return payload
+        
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            with self._jwt_cache_lock:
+                self._jwt_cache[token] = payload
             return payload
         except jwt.ExpiredSignatureError:
             self.logger.warning("Token has expired")
@@ -175,8 +489,18 @@ class SecurityManager:
         :param email: Email to validate
         :return: Boolean indicating valid email
         """
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(email_regex, email) is not None
+        # Equivalent to ^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$ without the regex engine
+        local, at, domain = email.partition('@')
+        if not at or not local or not _EMAIL_LOCAL_CHARS.issuperset(local):
+            return False
+        
+        host, dot, tld = domain.rpartition('.')
+        return bool(
+            dot and host
+            and len(tld) >= 2
+            and _EMAIL_TLD_CHARS.issuperset(tld)
+            and _EMAIL_DOMAIN_CHARS.issuperset(host)
+        )
 
     def validate_ip_address(self, ip):
         """
@@ -185,6 +509,17 @@ class SecurityManager:
         :param ip: IP address to validate
         :return: Boolean indicating valid IP
         """
+        # Dotted-quad IPv4 is checked inline; anything else goes to ipaddress
+        if isinstance(ip, str) and ':' not in ip:
+            octets = ip.split('.')
+            return len(octets) == 4 and all(
+                0 < len(octet) <= 3
+                and _DIGITS.issuperset(octet)
+                and (octet[0] != '0' or octet == '0')
+                and int(octet) <= 255
+                for octet in octets
+            )
+        
         try:
             ipaddress.ip_address(ip)
             return True
@@ -208,7 +543,7 @@ class SecurityManager:
         :return: Sanitized input
         """
         # Remove potentially dangerous characters
-        return re.sub(r'[<>&\'"()]', '', input_string)
+        return input_string.translate(_SANITIZE_TABLE)
 
 # Create a singleton instance
 security_manager = SecurityManager()